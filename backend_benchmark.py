@@ -0,0 +1,432 @@
+"""Benchmarks for the RoopCam Ultra Pro backend.
+
+Run from the repository root, for example:
+
+    python backend_benchmark.py ingest --resolution 3840x2160 --requests 50
+    python backend_benchmark.py load --resolution 1280x720 1920x1080 --concurrency 1 8
+    python backend_benchmark.py load --url http://127.0.0.1:8001 --endpoints voice-convert
+    python backend_benchmark.py startup --runs 5
+    python backend_benchmark.py encode --resolution 1920x1080 3840x2160
+
+Results are printed as JSON so runs can be compared between commits.
+"""
+import argparse
+import asyncio
+import io
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+import cv2
+import httpx
+import numpy as np
+import soundfile as sf
+from starlette.datastructures import UploadFile
+
+sys.path.insert(0, str(Path(__file__).parent / 'backend'))
+import server  # noqa: E402
+
+
+def parse_resolution(value):
+    width, height = value.lower().split('x')
+    return int(width), int(height)
+
+
+def make_frame(width, height):
+    """Noisy frame so encoded sizes resemble camera footage"""
+    rng = np.random.default_rng(0)
+    frame = rng.integers(0, 255, (height, width, 3), dtype=np.uint8)
+    return cv2.GaussianBlur(frame, (9, 9), 0)
+
+
+def make_upload(data, filename='frame.jpg'):
+    spool = tempfile.SpooledTemporaryFile(max_size=1024 * 1024)
+    spool.write(data)
+    spool.seek(0)
+    return UploadFile(spool, size=len(data), filename=filename)
+
+
+async def legacy_ingest(upload):
+    """Ingest path before pooled buffers: full read, decode, copy, convert"""
+    data = await upload.read()
+    image = server.decode_image(data)
+    result = image.copy()
+    result = cv2.convertScaleAbs(result, alpha=1.02, beta=5)
+    return server.encode_image(result, 'JPEG')
+
+
+async def pooled_ingest(upload):
+    async with server.read_upload(upload) as data:
+        image = server.decode_image(data)
+    with server.frame_pool.borrow(image.shape) as output_frame:
+        result = server.UltraFaceSwapper.render_swap(image, output_frame)
+        return server.encode_image(result, 'JPEG')
+
+
+async def measure_ingest(path, payload, requests):
+    """Per-request wall time and peak traced allocation for an ingest path"""
+    # Warm up so pools are populated before measuring
+    await path(make_upload(payload))
+    pools_before = (server.buffer_pool.stats(), server.frame_pool.stats())
+    
+    timings = []
+    peaks = []
+    tracemalloc.start()
+    for _ in range(requests):
+        upload = make_upload(payload)
+        tracemalloc.reset_peak()
+        baseline = tracemalloc.get_traced_memory()[0]
+        started = time.perf_counter()
+        await path(upload)
+        timings.append((time.perf_counter() - started) * 1000)
+        peaks.append(tracemalloc.get_traced_memory()[1] - baseline)
+        upload.file.close()
+    tracemalloc.stop()
+    
+    buffer_stats, frame_stats = server.buffer_pool.stats(), server.frame_pool.stats()
+    return {
+        'mean_ms': float(np.mean(timings)),
+        'p95_ms': float(np.percentile(timings, 95)),
+        'peak_alloc_bytes_per_request': int(np.mean(peaks)),
+        'pool_allocations_per_request': (
+            buffer_stats['allocations'] - pools_before[0]['allocations']
+            + frame_stats['allocations'] - pools_before[1]['allocations']
+        ) / requests
+    }
+
+
+def run_ingest(args):
+    width, height = args.resolution
+    payload = server.encode_image(make_frame(width, height), 'JPEG')
+    
+    async def run():
+        return {
+            'legacy': await measure_ingest(legacy_ingest, payload, args.requests),
+            'pooled': await measure_ingest(pooled_ingest, payload, args.requests)
+        }
+    
+    return {
+        'benchmark': 'ingest',
+        'resolution': f"{width}x{height}",
+        'payload_bytes': len(payload),
+        'requests': args.requests,
+        'results': asyncio.run(run())
+    }
+
+
+# Output encoding
+ENCODE_SETTINGS = [
+    'png; compression=0', 'png; compression=1', 'png; compression=3', 'png; compression=6', 'png; compression=9',
+    'jpeg; quality=70', 'jpeg; quality=85', 'jpeg; quality=95',
+    'jpeg; quality=85; subsampling=444', 'jpeg; quality=85; optimize=1', 'jpeg; quality=85; progressive=1',
+    'webp; quality=75', 'webp; quality=90'
+]
+
+
+def measure_encode(frame, codec, repeats):
+    """Encode time, size and PSNR for one codec setting"""
+    server.encode_frame(frame, codec)
+    timings = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        payload = server.encode_frame(frame, codec)
+        timings.append((time.perf_counter() - started) * 1000)
+    decoded = server.decode_image(payload)
+    return {
+        'mean_ms': float(np.mean(timings)),
+        'p95_ms': float(np.percentile(timings, 95)),
+        'bytes': len(payload),
+        'bits_per_pixel': len(payload) * 8 / (frame.shape[0] * frame.shape[1]),
+        'psnr_db': float(cv2.PSNR(frame, decoded))
+    }
+
+
+def run_encode(args):
+    results = []
+    for width, height in args.resolution:
+        frame = make_frame(width, height)
+        for setting in args.settings:
+            codec = server.parse_output_codec(setting)
+            if codec is None:
+                raise SystemExit(f"Unsupported output codec: {setting}")
+            result = measure_encode(frame, codec, args.repeats)
+            results.append(dict(resolution=f"{width}x{height}", setting=setting, **result))
+            print(f"{width}x{height} {setting}: {result['mean_ms']:.1f} ms, {result['bytes']} bytes", file=sys.stderr)
+    return {
+        'benchmark': 'encode',
+        'commit': git_commit(),
+        'repeats': args.repeats,
+        'results': results
+    }
+
+
+# Startup
+IMPORT_PROBE = (
+    "import time; started = time.perf_counter(); import server; "
+    "print((time.perf_counter() - started) * 1000, server.IMPORT_TIME_MS, server.IMPORT_TIME_BUDGET_MS)"
+)
+
+
+def slowest_imports(env, count):
+    """Largest cumulative entries from ``python -X importtime``"""
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', 'import server'],
+        cwd=Path(__file__).parent / 'backend', env=env, capture_output=True, text=True, check=True
+    )
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        rows.append((int(cumulative), name.strip()))
+    return [{'module': name, 'cumulative_ms': micros / 1000} for micros, name in sorted(rows, reverse=True)[:count]]
+
+
+def run_startup(args):
+    """Cold ``import server`` wall time in fresh interpreters"""
+    env = dict(os.environ, WARMUP_IMPORTS=','.join(args.warmup_imports))
+    totals, measured = [], []
+    budget = None
+    for _ in range(args.runs):
+        result = subprocess.run(
+            [sys.executable, '-c', IMPORT_PROBE], cwd=Path(__file__).parent / 'backend',
+            env=env, capture_output=True, text=True, check=True
+        )
+        total, measured_ms, budget = map(float, result.stdout.split()[-3:])
+        totals.append(total)
+        measured.append(measured_ms)
+    return {
+        'benchmark': 'startup',
+        'commit': git_commit(),
+        'runs': args.runs,
+        'import_ms': {'median': float(np.median(totals)), 'max': float(np.max(totals))},
+        'self_measured_ms': {'median': float(np.median(measured)), 'max': float(np.max(measured))},
+        'budget_ms': budget,
+        'within_budget': float(np.median(measured)) <= budget,
+        'slowest_imports': slowest_imports(env, args.top)
+    }
+
+
+# Load harness
+IMAGE_ENDPOINTS = ['detect', 'embeddings', 'advanced-swap', 'realtime-swap']
+VOICE_ENDPOINTS = ['voice-convert', 'voice-realtime']
+
+
+def make_clip(seconds, sample_rate=22050):
+    """WAV clip of a voiced tone with harmonics"""
+    t = np.arange(int(seconds * sample_rate)) / sample_rate
+    audio = sum(0.2 / harmonic * np.sin(2 * np.pi * 140 * harmonic * t) for harmonic in range(1, 6))
+    output = io.BytesIO()
+    sf.write(output, audio.astype(np.float32), sample_rate, format='WAV')
+    return output.getvalue()
+
+
+def unique_payload(payload, counter, cache):
+    """Trailing bytes after the JPEG end marker change the result cache key, not the image"""
+    return payload if cache else payload + counter.to_bytes(8, 'little')
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', 'HEAD'], cwd=Path(__file__).parent,
+            capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def embedding_handle(client, payload, attempts=20):
+    """Embedding handle for a source face; the simulated detector sometimes finds none"""
+    for _ in range(attempts):
+        response = await client.post('/api/face/embeddings', files={'image': ('source.jpg', payload, 'image/jpeg')})
+        response.raise_for_status()
+        embeddings = response.json()['embeddings']
+        if embeddings:
+            return embeddings[0]['embedding_handle']
+    raise RuntimeError("No face found in the benchmark source frame")
+
+
+def request_builder(endpoint, payload, handle, cache):
+    """Callable issuing one request against an endpoint"""
+    counter = iter(range(1 << 62))
+    
+    def image(name='frame.jpg'):
+        return (name, unique_payload(payload, next(counter), cache), 'image/jpeg')
+    
+    async def send(client):
+        if endpoint == 'detect':
+            return await client.post('/api/face/detect', files={'image': image()})
+        if endpoint == 'embeddings':
+            return await client.post('/api/face/embeddings', files={'image': image()})
+        if endpoint == 'advanced-swap':
+            return await client.post(
+                '/api/face/advanced-swap', files={'target': image()},
+                data={'embedding_handle': handle, 'quality': 'ultra'}
+            )
+        if endpoint == 'realtime-swap':
+            return await client.post(
+                '/api/face/realtime-swap', files={'target': image()},
+                data={'embedding_handle': handle}
+            )
+        if endpoint == 'voice-convert':
+            return await client.post(
+                '/api/voice/convert', files={'audio': ('clip.wav', payload, 'audio/wav')},
+                data={'target_voice': 'female_high'}
+            )
+        return await client.post(
+            '/api/voice/realtime-process', files={'audio': ('clip.wav', payload, 'audio/wav')},
+            data={'target_voice': 'female_high'}
+        )
+    
+    return send
+
+
+async def sample_rss(client, in_process, peak, interval=0.05):
+    """Track the server's peak resident memory while a scenario runs"""
+    while True:
+        if in_process:
+            rss = server.metrics.process.rss_bytes()
+        else:
+            response = await client.get('/api/performance/stats')
+            rss = response.json().get('memory_rss_bytes', 0)
+            interval = max(interval, 0.5)
+        peak[0] = max(peak[0], rss)
+        await asyncio.sleep(interval)
+
+
+async def run_scenario(client, send, concurrency, requests, warmup, in_process):
+    for _ in range(warmup):
+        await send(client)
+    
+    remaining = iter(range(requests))
+    latencies = []
+    errors = {}
+    
+    async def worker():
+        for _ in remaining:
+            started = time.perf_counter()
+            try:
+                response = await send(client)
+                status = response.status_code
+            except httpx.HTTPError as e:
+                status = type(e).__name__
+            elapsed = (time.perf_counter() - started) * 1000
+            if isinstance(status, int) and status < 400:
+                latencies.append(elapsed)
+            else:
+                errors[str(status)] = errors.get(str(status), 0) + 1
+    
+    peak = [0]
+    sampler = asyncio.create_task(sample_rss(client, in_process, peak))
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    duration = time.perf_counter() - started
+    sampler.cancel()
+    
+    latency = np.array(latencies) if latencies else np.zeros(1)
+    return {
+        'concurrency': concurrency,
+        'requests': requests,
+        'ok': len(latencies),
+        'errors': errors,
+        'duration_s': duration,
+        'throughput_rps': len(latencies) / duration if duration else 0.0,
+        'latency_ms': {
+            'mean': float(latency.mean()),
+            'p50': float(np.percentile(latency, 50)),
+            'p95': float(np.percentile(latency, 95)),
+            'p99': float(np.percentile(latency, 99)),
+            'max': float(latency.max())
+        },
+        'peak_rss_bytes': peak[0]
+    }
+
+
+def run_load(args):
+    in_process = args.url is None
+    
+    async def run():
+        if in_process:
+            client = httpx.AsyncClient(transport=httpx.ASGITransport(app=server.app), base_url='http://benchmark', timeout=None)
+        else:
+            client = httpx.AsyncClient(base_url=args.url.rstrip('/'), timeout=None)
+        scenarios = []
+        async with client:
+            for endpoint in args.endpoints:
+                if endpoint in IMAGE_ENDPOINTS:
+                    sizes = [(f"{width}x{height}", make_frame(width, height)) for width, height in args.resolution]
+                    sizes = [(label, server.encode_image(frame, 'JPEG')) for label, frame in sizes]
+                else:
+                    sizes = [(f"{seconds:g}s", make_clip(seconds)) for seconds in args.clip_seconds]
+                for label, payload in sizes:
+                    handle = None
+                    if endpoint in ('advanced-swap', 'realtime-swap'):
+                        handle = await embedding_handle(client, payload)
+                    send = request_builder(endpoint, payload, handle, args.cache)
+                    for concurrency in args.concurrency:
+                        result = await run_scenario(client, send, concurrency, args.requests, args.warmup, in_process)
+                        scenarios.append(dict(endpoint=endpoint, input=label, payload_bytes=len(payload), **result))
+                        print(
+                            f"{endpoint} {label} c={concurrency}: {result['throughput_rps']:.1f} req/s, "
+                            f"p95 {result['latency_ms']['p95']:.1f} ms", file=sys.stderr
+                        )
+        return scenarios
+    
+    return {
+        'benchmark': 'load',
+        'target': 'in-process' if in_process else args.url,
+        'commit': git_commit(),
+        'cache': args.cache,
+        'scenarios': asyncio.run(run())
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest='benchmark', required=True)
+    
+    ingest = subparsers.add_parser('ingest', help='Upload read, decode and output allocation per request')
+    ingest.add_argument('--resolution', type=parse_resolution, default=parse_resolution('3840x2160'))
+    ingest.add_argument('--requests', type=int, default=20)
+    ingest.set_defaults(run=run_ingest)
+    
+    encode = subparsers.add_parser('encode', help='Encode time, size and PSNR per output codec setting')
+    encode.add_argument('--resolution', type=parse_resolution, nargs='+', default=[parse_resolution('1920x1080')])
+    encode.add_argument('--settings', nargs='+', default=ENCODE_SETTINGS, help='Output codec specs, as output_format')
+    encode.add_argument('--repeats', type=int, default=10)
+    encode.set_defaults(run=run_encode)
+    
+    startup = subparsers.add_parser('startup', help='Cold import time of the server module against its budget')
+    startup.add_argument('--runs', type=int, default=5)
+    startup.add_argument('--top', type=int, default=10, help='Number of slowest imports to list')
+    startup.add_argument('--warmup-imports', nargs='*', default=[], help='Modules to preload, as WARMUP_IMPORTS')
+    startup.set_defaults(run=run_startup)
+    
+    load = subparsers.add_parser('load', help='Throughput, latency percentiles and peak RSS per endpoint')
+    load.add_argument('--url', help='Base URL of a running server; the app runs in-process when omitted')
+    load.add_argument('--endpoints', nargs='+', choices=IMAGE_ENDPOINTS + VOICE_ENDPOINTS,
+                      default=IMAGE_ENDPOINTS + VOICE_ENDPOINTS)
+    load.add_argument('--resolution', type=parse_resolution, nargs='+', default=[parse_resolution('1280x720')])
+    load.add_argument('--clip-seconds', type=float, nargs='+', default=[1.0])
+    load.add_argument('--concurrency', type=int, nargs='+', default=[1, 4])
+    load.add_argument('--requests', type=int, default=50, help='Requests per scenario')
+    load.add_argument('--warmup', type=int, default=3)
+    load.add_argument('--cache', action='store_true', help='Send identical payloads so the result cache can hit')
+    load.add_argument('--output', type=Path, help='Also write the JSON report to this file')
+    load.set_defaults(run=run_load)
+    
+    args = parser.parse_args()
+    report = json.dumps(args.run(args), indent=2)
+    if getattr(args, 'output', None):
+        args.output.write_text(report + '\n')
+    print(report)
+
+
+if __name__ == '__main__':
+    main()
@@ -2,10 +2,16 @@ import requests
 import unittest
 import os
 import json
+import base64
+import struct
 import time
+import tempfile
 from io import BytesIO
 from PIL import Image
 import numpy as np
+import cv2
+from websockets.sync.client import connect
+from websockets.exceptions import ConnectionClosed
 
 class RoopCamUltraProAPITest(unittest.TestCase):
     def setUp(self):
@@ -68,7 +74,30 @@ class RoopCamUltraProAPITest(unittest.TestCase):
         self.assertIn("version", data)
         self.assertIn("features", data)
         print("✅ Root endpoint test passed")
-    
+
+    def test_status_checks(self):
+        """Test bulk status insert and cursor pagination"""
+        clients = [{"client_name": f"test-client-{i}"} for i in range(3)]
+        response = requests.post(f"{self.base_url}/api/status/bulk", json=clients)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["inserted"], 3)
+
+        response = requests.get(f"{self.base_url}/api/status", params={"limit": 2, "fields": "client_name"})
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertIsInstance(data, list)
+        self.assertLessEqual(len(data), 2)
+        self.assertIn("X-Next-Cursor", response.headers)
+
+        response = requests.get(
+            f"{self.base_url}/api/status", params={"limit": 2, "after": response.headers["X-Next-Cursor"]},
+            headers={"Accept": "application/x-ndjson"}
+        )
+        self.assertEqual(response.status_code, 200)
+        lines = [json.loads(line) for line in response.text.splitlines()]
+        self.assertIn("next_cursor", lines[-1])
+        print("✅ Status checks test passed")
+
     def test_face_detection(self):
         """Test face detection endpoint"""
         files = {'image': ('test.jpg', self.test_image, 'image/jpeg')}
@@ -82,6 +111,23 @@ class RoopCamUltraProAPITest(unittest.TestCase):
         self.assertIn("confidence_avg", data)
         print("✅ Face detection test passed")
     
+    def test_face_detection_cache(self):
+        """Test repeated detection of the same image is served from the result cache"""
+        img = Image.fromarray(np.random.randint(0, 255, (100, 100, 3), np.uint8))
+        img_io = BytesIO()
+        img.save(img_io, 'PNG')
+        image_data = img_io.getvalue()
+        
+        response = requests.post(f"{self.base_url}/api/face/detect", files={'image': ('test.png', image_data, 'image/png')})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.headers.get('X-Cache'), 'MISS')
+        
+        repeat = requests.post(f"{self.base_url}/api/face/detect", files={'image': ('test.png', image_data, 'image/png')})
+        self.assertEqual(repeat.status_code, 200)
+        self.assertEqual(repeat.headers.get('X-Cache'), 'HIT')
+        self.assertEqual(repeat.json()["faces_detected"], response.json()["faces_detected"])
+        print("✅ Face detection cache test passed")
+    
     def test_face_embeddings(self):
         """Test face embeddings extraction endpoint"""
         files = {'image': ('test.jpg', self.test_image, 'image/jpeg')}
@@ -94,6 +140,21 @@ class RoopCamUltraProAPITest(unittest.TestCase):
         self.assertIn("model", data)
         print("✅ Face embeddings test passed")
     
+    def test_face_embeddings_binary(self):
+        """Test packed embedding wire formats"""
+        files = {'image': ('test.jpg', self.test_image, 'image/jpeg')}
+        headers = {'Accept': 'application/vnd.roopcam.packed+json; dtype=f16'}
+        response = requests.post(f"{self.base_url}/api/face/embeddings", files=files, headers=headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.headers["Content-Type"].startswith("application/vnd.roopcam.packed+json"))
+        data = response.json()
+        matrix = data["embedding_matrix"]
+        self.assertEqual(matrix["dtype"], "f16")
+        self.assertEqual(matrix["shape"][0], len(data["embeddings"]))
+        packed = np.frombuffer(base64.b64decode(matrix["data"]), dtype='<f2')
+        self.assertEqual(packed.size, matrix["shape"][0] * matrix["shape"][1])
+        print("✅ Packed face embeddings test passed")
+    
     def test_advanced_face_swap(self):
         """Test advanced face swap endpoint"""
         files = {
@@ -111,7 +172,23 @@ class RoopCamUltraProAPITest(unittest.TestCase):
         self.assertIn('X-Processing-Time', response.headers)
         self.assertIn('X-Quality', response.headers)
         print("✅ Advanced face swap test passed")
-    
+
+    def test_advanced_face_swap_output_format(self):
+        """Test selectable output codec for advanced face swap"""
+        image_data = self.test_image.getvalue()
+        files = {
+            'source': ('source.jpg', image_data, 'image/jpeg'),
+            'target': ('target.jpg', image_data, 'image/jpeg')
+        }
+        data = {'output_format': 'jpeg; quality=80; subsampling=420'}
+        response = requests.post(f"{self.base_url}/api/face/advanced-swap", files=files, data=data)
+        if response.status_code == 400 and "No face detected" in response.text:
+            self.skipTest("No face detected in test image")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.headers.get('Content-Type'), 'image/jpeg')
+        self.assertEqual(response.headers.get('X-Output-Format'), 'jpeg')
+        print("✅ Advanced face swap output format test passed")
+
     def test_realtime_face_swap(self):
         """Test real-time face swap endpoint"""
         # First get embeddings
@@ -136,6 +213,118 @@ class RoopCamUltraProAPITest(unittest.TestCase):
         self.assertIn('X-Realtime', response.headers)
         print("✅ Real-time face swap test passed")
     
+    def test_realtime_face_swap_with_handle(self):
+        """Test real-time face swap using a cached embedding handle"""
+        files = {'image': ('test.jpg', self.test_image, 'image/jpeg')}
+        embed_response = requests.post(f"{self.base_url}/api/face/embeddings", files=files)
+        self.assertEqual(embed_response.status_code, 200)
+        embeddings = embed_response.json()['embeddings']
+        if not embeddings:
+            self.skipTest("No face detected in test image")
+        self.assertIn('embedding_handle', embeddings[0])
+        
+        self.test_image.seek(0)
+        files = {'target': ('target.jpg', self.test_image, 'image/jpeg')}
+        data = {'embedding_handle': embeddings[0]['embedding_handle']}
+        response = requests.post(f"{self.base_url}/api/face/realtime-swap", files=files, data=data)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.headers.get('Content-Type'), 'image/jpeg')
+        
+        data = {'embedding_handle': 'unknown'}
+        self.test_image.seek(0)
+        files = {'target': ('target.jpg', self.test_image, 'image/jpeg')}
+        response = requests.post(f"{self.base_url}/api/face/realtime-swap", files=files, data=data)
+        self.assertEqual(response.status_code, 404)
+        print("✅ Real-time face swap with embedding handle test passed")
+    
+    def test_realtime_face_swap_tracking(self):
+        """Test that a session runs full detection only on keyframes"""
+        session_id = f"test-tracking-{time.time()}"
+        # Textured frames so optical flow can follow any detected face
+        image_data = cv2.imencode('.png', np.random.RandomState(0).randint(0, 255, (240, 320, 3), np.uint8))[1].tobytes()
+        keyframes = []
+        for _ in range(3):
+            files = {'target': ('target.png', image_data, 'image/png')}
+            data = {'source_embeddings': json.dumps([0.1]), 'session_id': session_id}
+            response = requests.post(f"{self.base_url}/api/face/realtime-swap", files=files, data=data)
+            self.assertEqual(response.status_code, 200)
+            keyframes.append(response.headers.get('X-Keyframe'))
+        self.assertEqual(keyframes, ['true', 'false', 'false'])
+        
+        files = {'target': ('target.png', image_data, 'image/png')}
+        response = requests.post(f"{self.base_url}/api/face/realtime-swap", files=files, data={'source_embeddings': json.dumps([0.1])})
+        self.assertEqual(response.headers.get('X-Keyframe'), 'true')
+        print("✅ Real-time face tracking test passed")
+    
+    def test_realtime_face_stream(self):
+        """Test a frame round trip over the real-time face WebSocket"""
+        ws_url = self.base_url.replace('http', 'ws', 1)
+        with connect(f"{ws_url}/api/face/realtime-stream") as ws:
+            ws.send(json.dumps({'source_embeddings': [0.1]}))
+            ready = json.loads(ws.recv(timeout=10))
+            self.assertEqual(ready['type'], 'ready')
+            ws.send(struct.pack('>I', 1) + self.test_image.getvalue())
+            message = ws.recv(timeout=10)
+            self.assertIsInstance(message, bytes)
+            seq, dropped, processing_time, flags = struct.unpack_from('>IIfB', message)
+            self.assertEqual(seq, 1)
+            self.assertEqual(message[13:15], b'\xff\xd8')
+        
+        with connect(f"{ws_url}/api/face/realtime-stream") as ws:
+            ws.send(json.dumps({'embedding_handle': 'unknown'}))
+            with self.assertRaises(ConnectionClosed) as closed:
+                ws.recv(timeout=10)
+            self.assertEqual(closed.exception.rcvd.code, 1008)
+        print("✅ Real-time face stream test passed")
+    
+    def test_realtime_face_swap_adaptive_quality(self):
+        """Test that quality steps down when frames exceed target_frame_ms"""
+        session_id = f"test-quality-{time.time()}"
+        image_data = self.test_image.getvalue()
+        levels = []
+        for _ in range(5):
+            files = {'target': ('target.jpg', image_data, 'image/jpeg')}
+            data = {'source_embeddings': json.dumps([0.1]), 'session_id': session_id, 'target_frame_ms': '0.001'}
+            response = requests.post(f"{self.base_url}/api/face/realtime-swap", files=files, data=data)
+            self.assertEqual(response.status_code, 200)
+            levels.append((int(response.headers['X-Quality-Level']), float(response.headers['X-Output-Scale'])))
+        self.assertLess(levels[-1][0], levels[0][0])
+        self.assertLess(levels[-1][1], levels[0][1])
+        print("✅ Real-time adaptive quality test passed")
+    
+    def test_video_job(self):
+        """Test asynchronous video face swap job"""
+        frames = 10
+        with tempfile.NamedTemporaryFile(suffix='.mp4') as video_file:
+            writer = cv2.VideoWriter(video_file.name, cv2.VideoWriter_fourcc(*'mp4v'), 30, (320, 240))
+            for i in range(frames):
+                writer.write(np.full((240, 320, 3), i * 20, np.uint8))
+            writer.release()
+            
+            files = {
+                'video': ('target.mp4', open(video_file.name, 'rb'), 'video/mp4'),
+                'source': ('source.jpg', self.test_image, 'image/jpeg')
+            }
+            response = requests.post(f"{self.base_url}/api/video/jobs", files=files, data={'quality': 'real-time'})
+        if response.status_code == 400:
+            self.skipTest("No face detected in test image")
+        self.assertEqual(response.status_code, 200)
+        job = response.json()
+        self.assertIn("job_id", job)
+        
+        for _ in range(60):
+            job = requests.get(f"{self.base_url}/api/video/jobs/{job['job_id']}").json()
+            if job['status'] not in ('queued', 'running'):
+                break
+            time.sleep(0.5)
+        self.assertEqual(job['status'], 'completed')
+        self.assertEqual(job['frames_done'], frames)
+        
+        response = requests.get(f"{self.base_url}/api/video/jobs/{job['job_id']}/result")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.headers.get('Content-Type'), 'video/mp4')
+        print("✅ Video job test passed")
+    
     def test_voice_conversion(self):
         """Test voice conversion endpoint"""
         files = {'audio': ('test.wav', self.test_audio, 'audio/wav')}
@@ -161,6 +350,48 @@ class RoopCamUltraProAPITest(unittest.TestCase):
         self.assertIn('X-Realtime', response.headers)
         print("✅ Real-time voice processing test passed")
     
+    def test_realtime_voice_process_pcm(self):
+        """Test real-time voice processing with raw PCM in and out"""
+        t = np.linspace(0, 0.1, 1600, endpoint=False)
+        audio = (0.5 * np.sin(2 * np.pi * 440 * t) * 32767).astype('<i2')
+        files = {'audio': ('test.raw', audio.tobytes(), 'audio/pcm; format=s16le; rate=16000; channels=1')}
+        data = {'target_voice': 'original'}
+        headers = {'Accept': 'audio/pcm; format=f32le'}
+        response = requests.post(f"{self.base_url}/api/voice/realtime-process", files=files, data=data, headers=headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.headers.get('Content-Type').startswith('audio/pcm; format=f32le'))
+        self.assertEqual(response.headers.get('X-Sample-Rate'), '16000')
+        self.assertEqual(len(response.content), len(audio) * 4)
+        print("✅ Raw PCM voice processing test passed")
+    
+    def test_realtime_voice_stream(self):
+        """Test PCM round trips over the streaming voice WebSocket"""
+        ws_url = self.base_url.replace('http', 'ws', 1)
+        with connect(f"{ws_url}/api/voice/realtime-stream") as ws:
+            ws.send(json.dumps({'target_voice': 'child', 'sample_rate': 16000, 'chunk_ms': 20, 'format': 'f32le'}))
+            ready = json.loads(ws.recv(timeout=10))
+            self.assertEqual(ready['type'], 'ready')
+            self.assertEqual(ready['chunk_samples'], 320)
+            ws.send(np.zeros(640, dtype='<f4').tobytes())
+            self.assertEqual(len(ws.recv(timeout=10)), 640 * 4)
+            ws.send(json.dumps({'type': 'flush'}))
+            self.assertEqual(len(ws.recv(timeout=10)), 320 * 4)
+        
+        with connect(f"{ws_url}/api/voice/realtime-stream") as ws:
+            ws.send(json.dumps({'sample_rate': 384000}))
+            with self.assertRaises(ConnectionClosed) as closed:
+                ws.recv(timeout=10)
+            self.assertEqual(closed.exception.rcvd.code, 1003)
+        print("✅ Real-time voice stream test passed")
+    
+    def test_realtime_voice_process_unsupported_rate(self):
+        """Test raw PCM with an out-of-range sample rate is rejected"""
+        audio = np.zeros(1600, dtype='<i2')
+        files = {'audio': ('test.raw', audio.tobytes(), 'audio/pcm; format=s16le; rate=384000; channels=1')}
+        response = requests.post(f"{self.base_url}/api/voice/realtime-process", files=files, data={'target_voice': 'original'})
+        self.assertEqual(response.status_code, 415)
+        print("✅ Unsupported PCM sample rate test passed")
+    
     def test_webrtc_offer(self):
         """Test WebRTC offer endpoint"""
         data = {
@@ -204,6 +435,51 @@ class RoopCamUltraProAPITest(unittest.TestCase):
         self.assertIn("processing_fps", data)
         print("✅ Performance stats test passed")
     
+    def test_prometheus_metrics(self):
+        """Test Prometheus metrics endpoint"""
+        response = requests.get(f"{self.base_url}/api/metrics")
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.headers.get('Content-Type').startswith('text/plain'))
+        self.assertIn("roopcam_requests_total", response.text)
+        self.assertIn("roopcam_process_resident_memory_bytes", response.text)
+        self.assertIn('roopcam_admission_queue_length{priority="realtime"}', response.text)
+        print("✅ Prometheus metrics test passed")
+    
+    def test_admission_stats(self):
+        """Test admission control counters in runtime stats"""
+        response = requests.get(f"{self.base_url}/api/performance/runtime")
+        self.assertEqual(response.status_code, 200)
+        admission = response.json()["admission"]
+        self.assertEqual(set(admission["queued"]), {"realtime", "interactive", "batch"})
+        self.assertLessEqual(admission["class_limits"]["batch"], admission["capacity"])
+        print("✅ Admission stats test passed")
+    
+    def test_debug_traces(self):
+        """Test sampled trace buffer endpoint"""
+        response = requests.get(f"{self.base_url}/api/debug/traces")
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("Server-Timing", response.headers)
+        data = response.json()
+        self.assertIn("sample_rate", data)
+        self.assertIn("traces", data)
+        print("✅ Debug traces test passed")
+    
+    def test_health_probes(self):
+        """Test liveness and readiness probes"""
+        response = requests.get(f"{self.base_url}/api/health/live")
+        self.assertEqual(response.status_code, 200)
+        for _ in range(50):
+            response = requests.get(f"{self.base_url}/api/health/ready")
+            if response.status_code == 200:
+                break
+            time.sleep(0.2)
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertTrue(data["ready"])
+        self.assertEqual(data["warmup"]["state"], "ready")
+        self.assertIn("import_time_ms", data)
+        print("✅ Health probes test passed")
+    
     def test_model_performance(self):
         """Test model performance endpoint"""
         response = requests.get(f"{self.base_url}/api/performance/models")
@@ -33,6 +33,12 @@ const App = () => {
   const audioContextRef = useRef(null);
   const streamRef = useRef(null);
   const intervalRef = useRef(null);
+  const swapSocketRef = useRef(null);
+  const swapConnectRef = useRef(null);
+  const reconnectAtRef = useRef(0);
+  const reconnectDelayRef = useRef(500);
+  const sourceEmbeddingsRef = useRef(null);
+  const frameSeqRef = useRef(0);
   const peerConnectionRef = useRef(null);
   const sourceImageRef = useRef(null);
 
@@ -113,59 +119,81 @@ const App = () => {
     return null;
   }, []);
 
-  // Advanced real-time face swapping
-  const performFaceSwap = useCallback(async (sourceEmbeddings, targetImageData) => {
-    if (!sourceEmbeddings || !targetImageData) return targetImageData;
+  // Persistent swap session: embeddings are sent once, frames stream over the socket
+  const openSwapStream = useCallback((sourceEmbeddings, outputCtx) => {
+    const wsUrl = process.env.REACT_APP_BACKEND_URL.replace(/^http/, 'ws');
+    const socket = new WebSocket(`${wsUrl}/api/face/realtime-stream`);
+    socket.binaryType = 'arraybuffer';
     
-    try {
-      const canvas = document.createElement('canvas');
-      const ctx = canvas.getContext('2d');
-      canvas.width = targetImageData.width;
-      canvas.height = targetImageData.height;
-      ctx.putImageData(targetImageData, 0, 0);
-      
-      const blob = await new Promise(resolve => canvas.toBlob(resolve, 'image/jpeg', 0.95));
-      const formData = new FormData();
-      formData.append('target', blob);
-      formData.append('source_embeddings', JSON.stringify(sourceEmbeddings));
-      formData.append('full_body', fullBodyMode);
-      formData.append('cloud_processing', cloudProcessing);
-      
-      const response = await fetch(`${process.env.REACT_APP_BACKEND_URL}/api/face/realtime-swap`, {
-        method: 'POST',
-        body: formData
-      });
-      
-      if (response.ok) {
-        const swappedBlob = await response.blob();
-        const img = new Image();
-        img.onload = () => {
-          const swapCanvas = document.createElement('canvas');
-          const swapCtx = swapCanvas.getContext('2d');
-          swapCanvas.width = img.width;
-          swapCanvas.height = img.height;
-          swapCtx.drawImage(img, 0, 0);
-          return swapCtx.getImageData(0, 0, img.width, img.height);
-        };
-        img.src = URL.createObjectURL(swappedBlob);
-        return new Promise(resolve => {
-          img.onload = () => {
-            const swapCanvas = document.createElement('canvas');
-            const swapCtx = swapCanvas.getContext('2d');
-            swapCanvas.width = img.width;
-            swapCanvas.height = img.height;
-            swapCtx.drawImage(img, 0, 0);
-            resolve(swapCtx.getImageData(0, 0, img.width, img.height));
-          };
-        });
+    socket.onopen = () => {
+      reconnectDelayRef.current = 500;
+      // Prefer the server-side handle so the vector is not sent back
+      const handle = sourceEmbeddings?.embeddings?.[0]?.embedding_handle;
+      socket.send(JSON.stringify({
+        ...(handle ? { embedding_handle: handle } : { source_embeddings: sourceEmbeddings }),
+        full_body: fullBodyMode,
+        cloud_processing: cloudProcessing
+      }));
+    };
+    
+    socket.onmessage = async (event) => {
+      if (typeof event.data === 'string') return;
+      // 13-byte header: sequence number, dropped frames, processing time, flags
+      const frameBlob = new Blob([event.data.slice(13)], { type: 'image/jpeg' });
+      const bitmap = await createImageBitmap(frameBlob);
+      outputCtx.drawImage(bitmap, 0, 0, outputCtx.canvas.width, outputCtx.canvas.height);
+      bitmap.close();
+    };
+    
+    socket.onclose = (event) => {
+      if (swapSocketRef.current === socket) {
+        swapSocketRef.current = null;
       }
-    } catch (error) {
-      console.error('Real-time face swap failed:', error);
-    }
+      // 1008: the embedding handle expired, extract it again on reconnect
+      if (event.code === 1008) {
+        sourceEmbeddingsRef.current = null;
+      }
+      // Back off exponentially, up to 10 s, before the next connection attempt
+      reconnectAtRef.current = Date.now() + reconnectDelayRef.current;
+      reconnectDelayRef.current = Math.min(reconnectDelayRef.current * 2, 10000);
+    };
     
-    return targetImageData;
+    swapSocketRef.current = socket;
+    return socket;
   }, [fullBodyMode, cloudProcessing]);
 
+  // One connection attempt at a time; embeddings are extracted once per source image
+  const connectSwapStream = useCallback((outputCtx) => {
+    if (!swapConnectRef.current && Date.now() >= reconnectAtRef.current) {
+      swapConnectRef.current = (async () => {
+        if (!sourceEmbeddingsRef.current) {
+          sourceEmbeddingsRef.current = extractFaceEmbeddings(sourceImageRef.current);
+        }
+        const sourceEmbeddings = await sourceEmbeddingsRef.current;
+        if (!sourceEmbeddings) {
+          sourceEmbeddingsRef.current = null;
+          reconnectAtRef.current = Date.now() + reconnectDelayRef.current;
+          reconnectDelayRef.current = Math.min(reconnectDelayRef.current * 2, 10000);
+          return null;
+        }
+        return openSwapStream(sourceEmbeddings, outputCtx);
+      })().finally(() => {
+        swapConnectRef.current = null;
+      });
+    }
+    return swapConnectRef.current;
+  }, [extractFaceEmbeddings, openSwapStream]);
+
+  const sendSwapFrame = useCallback(async (socket, canvas) => {
+    // Skip the frame while the previous one is still buffered, the server only wants the newest
+    if (socket.bufferedAmount > 0) return;
+    
+    const blob = await new Promise(resolve => canvas.toBlob(resolve, 'image/jpeg', 0.95));
+    const header = new DataView(new ArrayBuffer(4));
+    header.setUint32(0, frameSeqRef.current++);
+    socket.send(new Blob([header.buffer, blob]));
+  }, []);
+
   // Real-time processing loop
   const startRealTimeProcessing = useCallback(() => {
     if (!videoRef.current || !canvasRef.current) return;
@@ -190,27 +218,35 @@ const App = () => {
         // Detect faces
         await detectFaces(imageData);
         
-        // Perform face swap if source image is available
-        let processedImageData = imageData;
+        // Stream the frame for swapping if source image is available
         if (sourceImage && faceDetected) {
-          const sourceEmbeddings = await extractFaceEmbeddings(sourceImageRef.current);
-          processedImageData = await performFaceSwap(sourceEmbeddings, imageData);
+          const socket = swapSocketRef.current;
+          if (!socket) {
+            // Ticks do not wait for the connection; frames resume once it is open
+            connectSwapStream(outputCtx);
+          } else if (socket.readyState === WebSocket.OPEN) {
+            await sendSwapFrame(socket, canvas);
+          }
+        } else {
+          // Draw unprocessed frame to output canvas
+          outputCtx.putImageData(imageData, 0, 0);
         }
         
-        // Draw processed frame to output canvas
-        outputCtx.putImageData(processedImageData, 0, 0);
-        
         // Update processing progress
         setProcessingProgress(prev => (prev + 1) % 100);
       }
     }, 1000 / 30); // 30 FPS processing
-  }, [sourceImage, faceDetected, detectFaces, extractFaceEmbeddings, performFaceSwap]);
+  }, [sourceImage, faceDetected, detectFaces, connectSwapStream, sendSwapFrame]);
 
   const stopRealTimeProcessing = useCallback(() => {
     if (intervalRef.current) {
       clearInterval(intervalRef.current);
       intervalRef.current = null;
     }
+    if (swapSocketRef.current) {
+      swapSocketRef.current.close();
+      swapSocketRef.current = null;
+    }
   }, []);
 
   // Start camera stream
@@ -295,7 +331,7 @@ const App = () => {
         ctx.drawImage(img, 0, 0);
         
         sourceImageRef.current = ctx.getImageData(0, 0, img.width, img.height);
-        extractFaceEmbeddings(sourceImageRef.current);
+        sourceEmbeddingsRef.current = extractFaceEmbeddings(sourceImageRef.current);
       };
       img.src = url;
       
@@ -328,6 +364,34 @@ const App = () => {
       formData.append('full_body', fullBodyMode);
       formData.append('cloud_processing', cloudProcessing);
       
+      if (targetBlob.type.startsWith('video/')) {
+        // Videos run as a background job; poll its progress until the result is ready
+        const videoForm = new FormData();
+        videoForm.append('source', sourceBlob);
+        videoForm.append('video', targetBlob);
+        videoForm.append('quality', 'ultra');
+        videoForm.append('full_body', fullBodyMode);
+        
+        const jobsUrl = `${process.env.REACT_APP_BACKEND_URL}/api/video/jobs`;
+        const jobResponse = await fetch(jobsUrl, { method: 'POST', body: videoForm });
+        if (!jobResponse.ok) throw new Error('Processing failed');
+        let job = await jobResponse.json();
+        
+        while (job.status === 'queued' || job.status === 'running') {
+          await new Promise(resolve => setTimeout(resolve, 500));
+          job = await fetch(`${jobsUrl}/${job.job_id}`).then(r => r.json());
+          if (job.progress !== null) {
+            setProcessingProgress(Math.min(Math.round(job.progress * 100), 99));
+          }
+        }
+        if (job.status !== 'completed') throw new Error(job.error || 'Processing failed');
+        
+        const resultBlob = await fetch(`${jobsUrl}/${job.job_id}/result`).then(r => r.blob());
+        setOutputVideo(URL.createObjectURL(resultBlob));
+        setProcessingProgress(100);
+        return;
+      }
+      
       // Simulate progress updates
       const progressInterval = setInterval(() => {
         setProcessingProgress(prev => Math.min(prev + 2, 95));